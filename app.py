@@ -1,20 +1,27 @@
+import os
 import random
 import warnings
 
 import numpy as np
 import pandas as pd
 import streamlit as st
+import pyarrow as pa
+import pyarrow.parquet as pq
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from streamlit_autorefresh import st_autorefresh
+from shapely.geometry import mapping, shape
 
 
 warnings.filterwarnings("ignore")
-st_autorefresh(interval=100000, limit=None, key="datarefresh")
 
 DATA_PATH = "India Agriculture Crop Production.csv"
+DATA_CHECK_INTERVAL = 30  # seconds between checks for a modified data file
+FILTER_CACHE_ENTRIES = 16  # most recent sidebar selections kept by apply_filters
+PARQUET_PATH = "india_agri.parquet"
+PARQUET_SOURCE_KEY = b'source_csv'  # Parquet metadata key holding the CSV signature the cache was built from
 GEO_PATH = 'india_state_geo.json'
+GEO_SIMPLIFY_TOLERANCE = 0.01  # degrees; plenty for state-level choropleths
 
 DEFAULT_STATE = 'Gujarat'
 DEFAULT_CROP = 'Rice'
@@ -72,13 +79,40 @@ unsafe_allow_html=True
 @st.cache_data
 def load_data():
     """Load and preprocess the agriculture dataset"""
-    df = pd.read_csv(DATA_PATH)
+    # Taken before parsing, so a CSV rewritten mid-parse leaves a cache that no longer matches
+    csv_stat = os.stat(DATA_PATH)
+    source_signature = f"{csv_stat.st_mtime_ns}:{csv_stat.st_size}".encode()
+    
+    # Reuse the preprocessed Parquet copy only if it was built from this exact CSV and is
+    # newer than this preprocessing code
+    if os.path.exists(PARQUET_PATH) and os.path.getmtime(PARQUET_PATH) >= os.path.getmtime(__file__):
+        try:
+            metadata = pq.read_schema(PARQUET_PATH).metadata or {}
+            if metadata.get(PARQUET_SOURCE_KEY) == source_signature:
+                return pd.read_parquet(PARQUET_PATH, engine='pyarrow')
+        except (pa.ArrowException, OSError):
+            pass  # Unreadable cache file; rebuild it from the CSV below
+    
+    df = pd.read_csv(
+        DATA_PATH,
+        engine='pyarrow',
+        usecols=['State', 'District', 'Crop', 'Year', 'Season', 'Area', 'Production'],
+        dtype={
+            'State': 'string',
+            'District': 'string',
+            'Crop': 'string',
+            'Year': 'string',
+            'Season': 'string',
+            'Area': 'float64',
+            'Production': 'float64'
+        }
+    )
     
     df.columns = df.columns.str.strip()
     # print(df.info())
     
     # Parse Year column from "YYYY-MM" format to integer year
-    df['Year'] = df['Year'].astype(str).str.split('-').str[0].astype(int)
+    df['Year'] = pd.to_numeric(df['Year'].str.slice(0, 4), downcast='integer')
     
     # Calculate Yield (Production per unit Area)
     df['Yield'] = df['Production'] / df['Area']
@@ -91,17 +125,106 @@ def load_data():
     df['Season'] = df['Season'].fillna('').str.strip()
     
     df = df.dropna(subset=['Crop'])
+    
+    # Store repeated text fields as categoricals so filters and groupbys work on integer codes
+    for col in ['State', 'District', 'Crop', 'Season']:
+        df[col] = df[col].astype('category')
+    
+    # Downcast numeric columns that are only filtered on or averaged; Area and Production
+    # stay float64 because their sums reach totals beyond float32 precision
+    df['Year'] = df['Year'].astype(np.int16)
+    df['Yield'] = df['Yield'].astype(np.float32)
+    
+    # Write to a temporary file and swap it in, so readers never see a partially written cache
+    tmp_path = f"{PARQUET_PATH}.{os.getpid()}.tmp"
+    try:
+        table = pa.Table.from_pandas(df)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            PARQUET_SOURCE_KEY: source_signature
+        })
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, PARQUET_PATH)
+    except OSError:
+        # Read-only deployments fall back to parsing the CSV each time
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
     return df
 
-@st.cache_data
+@st.cache_resource
 def load_geojson():
+    """Load state boundaries and simplify them to cut the payload sent to the browser"""
     import json
     with open(GEO_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+        geojson = json.load(f)
+    
+    for feature in geojson['features']:
+        geometry = shape(feature['geometry']).simplify(GEO_SIMPLIFY_TOLERANCE, preserve_topology=True)
+        feature['geometry'] = mapping(geometry)
+    
+    return geojson
+
+@st.cache_resource
+def cached_data_version():
+    """Process-wide record of the CSV mtime the shared data caches were built from"""
+    return {'mtime': None}
+
+@st.fragment(run_every=DATA_CHECK_INTERVAL)
+def watch_data_file():
+    """Rerun the app with fresh caches only when the CSV has changed on disk"""
+    mtime = os.path.getmtime(DATA_PATH)
+    
+    # Caches are shared by all sessions, so compare against the version they were built from
+    version = cached_data_version()
+    if version['mtime'] != mtime:
+        version['mtime'] = mtime
+        st.cache_data.clear()
+    
+    # Rerun sessions that are still showing data from an older version of the file
+    if st.session_state.setdefault('data_mtime', mtime) != mtime:
+        st.session_state.data_mtime = mtime
+        st.rerun()
 
 # ==================== DATA PROCESSING FUNCTIONS ====================
 
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES)
+def apply_filters(states, districts, crops, seasons, years):
+    """Filter the dataset on the sidebar selections (tuples); empty selections are ignored"""
+    df = load_data()
+    
+    # Compare integer category codes instead of strings, and fuse all filters into one mask
+    masks = [np.ones(len(df), dtype=bool)]
+    for col, selected in [('State', states), ('District', districts), ('Crop', crops), ('Season', seasons)]:
+        if selected:
+            selected_codes = df[col].cat.categories.get_indexer(selected)
+            selected_codes = selected_codes[selected_codes >= 0]  # -1 is the code for missing values
+            masks.append(np.isin(df[col].cat.codes.to_numpy(), selected_codes))
+    if years:
+        masks.append(np.isin(df['Year'].to_numpy(), years))
+    
+    return df.iloc[np.flatnonzero(np.logical_and.reduce(masks))]
+
+@st.cache_data
+def distinct_options():
+    """Sorted filter options for the sidebar, taken from the category indexes"""
+    df = load_data()
+    return {
+        'states': df['State'].cat.categories.tolist(),
+        'districts': df['District'].cat.categories.tolist(),
+        'crops': df['Crop'].cat.categories.tolist(),
+        'seasons': [season for season in df['Season'].cat.categories if season]
+    }
+
+@st.cache_data
+def state_to_districts():
+    """Map each state to the sorted list of its districts"""
+    pairs = load_data()[['State', 'District']].drop_duplicates().dropna()
+    return {
+        state: sorted(group['District'].tolist())
+        for state, group in pairs.groupby('State', observed=True, sort=False)
+    }
+
 def calculate_yield_decline(df, years=5):
     """ Identify states with >10% yield decline over specified years """
     current_year = df['Year'].max()
@@ -110,44 +233,61 @@ def calculate_yield_decline(df, years=5):
     # Filter data for the period
     period_data = df[(df['Year'] >= start_year) & (df['Year'] <= current_year)]
     
-    decline_list = []
-    
-    for crop in period_data['Crop'].unique():
-        for state in period_data['State'].unique():
-            subset = period_data[(period_data['Crop'] == crop) & 
-                                (period_data['State'] == state)]
-            
-            if len(subset) < 2:
-                continue
-            
-            # Calculate average yield for first and last 2 years
-            early_years = subset[subset['Year'] <= start_year + 2]['Yield'].mean()
-            recent_years = subset[subset['Year'] >= current_year - 2]['Yield'].mean()
-            
-            if pd.notna(early_years) and pd.notna(recent_years) and early_years > 0:
-                decline_pct = ((early_years - recent_years) / early_years) * 100
-                
-                if decline_pct > 10:  # Only include declines > 10%
-                    severity = 'Critical' if decline_pct > 30 else 'High' if decline_pct > 20 else 'Moderate'
-                    decline_list.append({
-                        'Crop': crop,
-                        'State': state,
-                        'Decline_Percentage': round(decline_pct, 2),
-                        'Early_Yield': round(early_years, 2),
-                        'Recent_Yield': round(recent_years, 2),
-                        'Severity': severity
-                    })
-    
-    if decline_list:
-        return pd.DataFrame(decline_list).sort_values('Decline_Percentage', ascending=False)
-    else:
-        # Return empty DataFrame with proper columns
-        return pd.DataFrame(columns=['Crop', 'State', 'Decline_Percentage', 'Early_Yield', 'Recent_Yield', 'Severity'])
+    crop_codes = period_data['Crop'].cat.codes.to_numpy().astype(np.int64)
+    state_codes = period_data['State'].cat.codes.to_numpy().astype(np.int64)
+    year = period_data['Year'].to_numpy()
+    yield_values = period_data['Yield'].to_numpy(dtype=np.float64)
+    
+    # Give every (crop, state) pair a group id from its category codes; -1 codes are missing keys
+    valid = (crop_codes >= 0) & (state_codes >= 0)
+    n_states = len(period_data['State'].cat.categories)
+    group_keys, group_ids = np.unique(crop_codes[valid] * n_states + state_codes[valid], return_inverse=True)
+    year = year[valid]
+    yield_values = yield_values[valid]
+    n_groups = len(group_keys)
+    
+    # Single pass of weighted bincounts for the first and last 2 years of each group
+    has_yield = ~np.isnan(yield_values)
+    early_rows = has_yield & (year <= start_year + 2)
+    recent_rows = has_yield & (year >= current_year - 2)
+    yield_values = np.where(has_yield, yield_values, 0.0)
+    
+    group_size = np.bincount(group_ids, minlength=n_groups)
+    early_cnt = np.bincount(group_ids, weights=early_rows, minlength=n_groups)
+    recent_cnt = np.bincount(group_ids, weights=recent_rows, minlength=n_groups)
+    early_sum = np.bincount(group_ids, weights=np.where(early_rows, yield_values, 0.0), minlength=n_groups)
+    recent_sum = np.bincount(group_ids, weights=np.where(recent_rows, yield_values, 0.0), minlength=n_groups)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        early = early_sum / early_cnt
+        recent = recent_sum / recent_cnt
+        decline_pct = (early - recent) / early * 100
+    
+    keep = (group_size >= 2) & (early_cnt > 0) & (recent_cnt > 0) & (early > 0)
+    keep &= decline_pct > 10  # Only include declines > 10%
+    
+    group_keys = group_keys[keep]
+    early = early[keep]
+    recent = recent[keep]
+    decline_pct = decline_pct[keep]
+    
+    severity = pd.cut(decline_pct, bins=[10, 20, 30, np.inf], labels=['Moderate', 'High', 'Critical'], right=True)
+    
+    decline_df = pd.DataFrame({
+        'Crop': pd.Categorical.from_codes(group_keys // n_states, dtype=period_data['Crop'].dtype),
+        'State': pd.Categorical.from_codes(group_keys % n_states, dtype=period_data['State'].dtype),
+        'Decline_Percentage': np.round(decline_pct, 2),
+        'Early_Yield': np.round(early, 2),
+        'Recent_Yield': np.round(recent, 2),
+        'Severity': severity
+    })
+    
+    return decline_df.sort_values('Decline_Percentage', ascending=False)
 
 def get_state_average_yield(df, crop, year):
     """Calculate state-level average yield for a specific crop and year"""
     subset = df[(df['Crop'] == crop) & (df['Year'] == year)]
-    return subset.groupby('State')['Yield'].mean().to_dict()
+    return subset.groupby('State', observed=True, sort=False)['Yield'].mean().to_dict()
 
 def prepare_correlation_data(df):
     """Prepare data for correlation matrix"""
@@ -156,13 +296,33 @@ def prepare_correlation_data(df):
 
 def prepare_time_series(df, group_by='Year'):
     """Aggregate data for time series visualization"""
-    ts_data = df.groupby(group_by).agg({
+    ts_data = df.groupby(group_by, observed=True).agg({
         'Area': 'sum',
         'Production': 'sum',
         'Yield': 'mean'
     }).reset_index()
     return ts_data
 
+def prepare_state_data(df):
+    """Aggregate yield, production and area by state"""
+    state_data = df.groupby('State', observed=True, sort=False).agg({
+        'Yield': 'mean',
+        'Production': 'sum',
+        'Area': 'sum'
+    }).reset_index()
+    return state_data
+
+def prepare_district_stats(df):
+    """Aggregate district statistics table, sorted by total production"""
+    district_stats = df.groupby('District', observed=True, sort=False).agg({
+        'Production': 'sum',
+        'Area': 'sum',
+        'Yield': 'mean'
+    }).round(2).reset_index()
+    district_stats.columns = ['District', 'Total Production', 'Total Area', 'Avg Yield']
+    district_stats = district_stats.sort_values('Total Production', ascending=False)
+    return district_stats
+
 # ==================== VISUALIZATION FUNCTIONS ====================
 
 def plot_correlation_matrix(df):
@@ -234,8 +394,7 @@ def plot_time_series(df):
 
 def plot_top_districts(df, top_n=10):
     """Bar chart of top producing districts"""
-    district_prod = df.groupby('District')['Production'].sum().reset_index()
-    district_prod = district_prod.nlargest(top_n, 'Production')
+    district_prod = df.groupby('District', observed=True, sort=False)['Production'].sum().nlargest(top_n).reset_index()
     
     fig = go.Figure(go.Bar(
         x=district_prod['Production'],
@@ -263,33 +422,46 @@ def plot_top_districts(df, top_n=10):
 
 def plot_yield_vs_area(df):
     """Scatter plot of Yield vs Production Area"""
-    # Sample data if too large
-    plot_data = df.dropna(subset=['Area', 'Yield', 'Production'])
-    if len(plot_data) > 5000:
-        plot_data = plot_data.sample(5000, random_state=42)
-    
-    fig = px.scatter(
-        plot_data,
-        x='Area',
-        y='Yield',
-        size='Production',
-        color='Crop',
-        hover_data=['State', 'District', 'Year'],
+    # Drop rows with missing values and sample if too large, working on row positions
+    values = df[['Area', 'Yield', 'Production']].to_numpy(dtype=np.float64)
+    idx = np.flatnonzero(~np.isnan(values).any(axis=1))
+    if idx.size > 5000:
+        idx = np.sort(np.random.default_rng(42).choice(idx, 5000, replace=False))
+    plot_data = df.take(idx)
+    
+    # Marker area scales with Production, largest marker 20px across (as in plotly express)
+    max_production = plot_data['Production'].max() if len(plot_data) > 0 else 0
+    sizeref = max_production / 20 ** 2 if max_production > 0 else 1
+    
+    fig = go.Figure()
+    for crop, group in plot_data.groupby('Crop', observed=True, sort=False):
+        fig.add_trace(go.Scattergl(
+            x=group['Area'].to_numpy(),
+            y=group['Yield'].to_numpy(),
+            name=str(crop),
+            mode='markers',
+            marker=dict(size=group['Production'].to_numpy(), sizemode='area', sizeref=sizeref),
+            customdata=group[['State', 'District', 'Year']].to_numpy(dtype=object),
+            hovertemplate=(
+                f"Crop={crop}<br>Production Area=%{{x}}<br>Yield (Production/Area)=%{{y}}"
+                "<br>Production=%{marker.size}<br>State=%{customdata[0]}"
+                "<br>District=%{customdata[1]}<br>Year=%{customdata[2]}<extra></extra>"
+            )
+        ))
+    
+    fig.update_layout(
         title="Yield vs Production Area",
-        labels={'Area': 'Production Area', 'Yield': 'Yield (Production/Area)'}
+        xaxis_title="Production Area",
+        yaxis_title="Yield (Production/Area)",
+        legend_title_text="Crop",
+        height=400
     )
     
-    fig.update_layout(height=400)
-    
     return fig
 
 def plot_yield_map(df):
     """Choropleth map of yield by state"""
-    state_yield = df.groupby('State').agg({
-        'Yield': 'mean',
-        'Production': 'sum',
-        'Area': 'sum'
-    }).reset_index()
+    state_yield = prepare_state_data(df)
     
     fig = px.choropleth(
         state_yield,
@@ -316,40 +488,50 @@ def plot_yield_area_scatter(yield_prod):
     """Scatter plot of Yield vs Production Area (Aggregated by State and Crop)"""    
     yield_prod = yield_prod.dropna(subset=['Area', 'Yield'])
     
-    fig = px.scatter(
-        yield_prod,
-        x='Area',
-        y='Yield',
-        # size='Production',
-        color='State',
-        hover_data=['Crop', 'Area'],
+    fig = go.Figure()
+    for state, group in yield_prod.groupby('State', observed=True, sort=False):
+        fig.add_trace(go.Scattergl(
+            x=group['Area'].to_numpy(),
+            y=group['Yield'].to_numpy(),
+            name=str(state),
+            mode='markers',
+            customdata=group[['Crop']].to_numpy(dtype=object),
+            hovertemplate=(
+                f"State={state}<br>Production Area=%{{x}}<br>Yield=%{{y}}"
+                "<br>Crop=%{customdata[0]}<extra></extra>"
+            )
+        ))
+    
+    fig.update_layout(
         title="Yield vs Production Area",
-        labels={
-            'Area': 'Production Area', 
-            'Yield': 'Yield'
-            # 'Production': 'Total Production'
-        }
+        xaxis_title="Production Area",
+        yaxis_title="Yield",
+        legend_title_text="State",
+        height=400
     )
     
-    fig.update_layout(height=400)
-    
     return fig
 
 
 def plot_cropwise_production(df):
     """Time series of crop-wise production"""
-    crop_ts = df.groupby(['Year', 'Crop'])['Production'].sum().reset_index()
-    
-    fig = px.line(
-        crop_ts,
-        x='Year',
-        y='Production',
-        color='Crop',
-        title="Crop-wise Production Over Time",
-        markers=True
-    )
+    crop_ts = df.groupby(['Year', 'Crop'], observed=True)['Production'].sum().reset_index()
+    
+    fig = go.Figure()
+    for crop, group in crop_ts.groupby('Crop', observed=True, sort=False):
+        fig.add_trace(go.Scatter(
+            x=group['Year'].to_numpy(),
+            y=group['Production'].to_numpy(),
+            name=str(crop),
+            mode='lines+markers',
+            hovertemplate=f"Crop={crop}<br>Year=%{{x}}<br>Production=%{{y}}<extra></extra>"
+        ))
     
     fig.update_layout(
+        title="Crop-wise Production Over Time",
+        xaxis_title="Year",
+        yaxis_title="Production",
+        legend_title_text="Crop",
         height=400,
         hovermode='x unified',
         legend=dict(orientation="v", yanchor="top", y=1, xanchor="left", x=1.02)
@@ -365,14 +547,17 @@ def main():
         unsafe_allow_html=True
     )
     
+    watch_data_file()
+    
     with st.spinner('Loading data...'):
         df = load_data()
         india_geojson = load_geojson()
     
     st.sidebar.header("Filters")
+    options = distinct_options()
     
     # State filter
-    all_states = sorted(df['State'].unique().tolist())
+    all_states = options['states']
     default_states = random.sample(all_states, 1)
     selected_states = st.sidebar.multiselect(
         "State (multi-select)",
@@ -382,9 +567,10 @@ def main():
     
     # Filter districts based on selected states
     if selected_states:
-        available_districts = sorted(df[df['State'].isin(selected_states)]['District'].unique().tolist())
+        districts_by_state = state_to_districts()
+        available_districts = sorted(set().union(*[districts_by_state.get(s, []) for s in selected_states]))
     else:
-        available_districts = sorted(df['District'].unique().tolist())
+        available_districts = options['districts']
     
     selected_districts = st.sidebar.multiselect(
         "District (multi-select)",
@@ -393,7 +579,7 @@ def main():
     )
     
     # Crop filter
-    all_crops = sorted(df['Crop'].unique().tolist())
+    all_crops = options['crops']
     selected_crops = st.sidebar.multiselect(
         "Crop (multi-select)",
         options=all_crops,
@@ -401,7 +587,7 @@ def main():
     )
     
     # Season filter
-    all_seasons = sorted(df['Season'].dropna().unique().tolist())
+    all_seasons = options['seasons']
     selected_seasons = st.sidebar.multiselect(
         "Season (multi-select)",
         options=all_seasons,
@@ -410,10 +596,10 @@ def main():
     
     # Year filter
     # Year column is already parsed as integer in load_data()
-    df_clean_year = df.dropna(subset=['Year'])
-    if len(df_clean_year) > 0:
-        min_year = int(df_clean_year['Year'].min())
-        max_year = int(df_clean_year['Year'].max())
+    # min()/max() skip missing values, so no need to copy the frame via dropna()
+    if df['Year'].notna().any():
+        min_year = int(df['Year'].min())
+        max_year = int(df['Year'].max())
         selected_years = st.sidebar.multiselect(
             "Year Selector (multi-select)",
             options=list(range(min_year, max_year + 1)),
@@ -423,18 +609,13 @@ def main():
         selected_years = []
     
     # Apply filters to the data
-    filtered_df = df.copy()
-
-    if selected_states:
-        filtered_df = filtered_df[filtered_df['State'].isin(selected_states)]
-    if selected_districts:
-        filtered_df = filtered_df[filtered_df['District'].isin(selected_districts)]
-    if selected_crops:
-        filtered_df = filtered_df[filtered_df['Crop'].isin(selected_crops)]
-    if selected_seasons:
-        filtered_df = filtered_df[filtered_df['Season'].isin(selected_seasons)]
-    if selected_years:
-        filtered_df = filtered_df[filtered_df['Year'].isin(selected_years)]
+    filtered_df = apply_filters(
+        tuple(selected_states),
+        tuple(selected_districts),
+        tuple(selected_crops),
+        tuple(selected_seasons),
+        tuple(selected_years)
+    )
     
     # Display filter summary
     st.sidebar.markdown("---")
@@ -498,11 +679,7 @@ def main():
         
         try:            
             # Prepare state-level data
-            state_data = filtered_df.groupby('State').agg({
-                'Yield': 'mean',
-                'Production': 'sum',
-                'Area': 'sum'
-            }).reset_index()
+            state_data = prepare_state_data(filtered_df)
             
             # Create choropleth map using the GeoJSON
             fig_map = px.choropleth(
@@ -558,8 +735,7 @@ def main():
             
             with col1:
                 st.markdown(f"#### Top Districts in {selected_state_for_districts}")
-                district_prod = state_df.groupby('District')['Production'].sum().reset_index()
-                district_prod = district_prod.nlargest(10, 'Production')
+                district_prod = state_df.groupby('District', observed=True, sort=False)['Production'].sum().nlargest(10).reset_index()
                 
                 fig_district_bar = go.Figure(go.Bar(
                     x=district_prod['Production'],
@@ -587,7 +763,7 @@ def main():
             with col2:
                 st.markdown(f"#### Year-over-Year Trend in {selected_state_for_districts}")
                 # Year-over-year trend
-                year_trend = state_df.groupby('Year').agg({
+                year_trend = state_df.groupby('Year', observed=True).agg({
                     'Production': 'sum',
                     'Area': 'sum',
                     'Yield': 'mean'
@@ -631,13 +807,7 @@ def main():
             
             # District statistics table
             st.markdown(f"#### District Statistics for {selected_state_for_districts}")
-            district_stats = state_df.groupby('District').agg({
-                'Production': 'sum',
-                'Area': 'sum',
-                'Yield': 'mean'
-            }).round(2).reset_index()
-            district_stats.columns = ['District', 'Total Production', 'Total Area', 'Avg Yield']
-            district_stats = district_stats.sort_values('Total Production', ascending=False)
+            district_stats = prepare_district_stats(state_df)
             st.dataframe(district_stats, width='stretch', hide_index=True)
 
 if __name__ == "__main__":